@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+End-to-end latency benchmark for fence_huaweicloud.py against mock_ecs_server.py.
+
+Runs status, list, off, reboot and monitor as separate agent processes (the way
+Pacemaker calls them) and reports p50/p99 wall time, ECS API calls per run and
+peak RSS. Results can be saved and compared against an earlier run:
+
+  python3 benchmark.py --save baseline.json
+  python3 benchmark.py --compare baseline.json --tolerance 0.2
+
+With --compare the exit code is 1 when any action got slower or used more memory
+than the tolerance allows, or started making more API calls. Listing a large
+project shows the memory the list path needs:
+
+  python3 benchmark.py --actions list,list-status --servers 20000 --latency-ms 0
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from mock_ecs_server import server_id, start_server
+
+ACTIONS = ["status", "list", "off", "reboot", "monitor"]
+# Actions that work on the whole project instead of one instance
+LIST_ACTIONS = ["list", "list-status"]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def mock_call(url, path, method="GET"):
+    request = urllib.request.Request(url + path, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def run_agent(args, url, config_file, action):
+    """Run the agent once, returns (seconds, peak RSS in KiB, exit code)"""
+    cmd = [args.python, args.agent,
+           "-a", "BENCHMARKAK", "-s", "BENCHMARKSK", "-r", "cn-north-4",
+           "--project-id", "0123456789abcdef0123456789abcdef",
+           "--endpoint", url, "--config-file", config_file,
+           "--status-cache-ttl", "0", "--monitor-cache-ttl", "0", "--power-wait", "0",
+           "--daemon-socket", os.path.join(os.path.dirname(config_file), "no-daemon.sock"),
+           "-o", action]
+    if action not in LIST_ACTIONS:
+        cmd += ["-n", server_id(0)]
+    start = time.perf_counter()
+    process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    if status and args.verbose:
+        sys.stderr.write(process.stderr.read().decode("utf-8", "replace"))
+    process.stderr.close()
+    return elapsed, usage.ru_maxrss, os.waitstatus_to_exitcode(status)
+
+
+def benchmark(args):
+    httpd, _ = start_server(servers=args.servers, latency=args.latency_ms / 1000.0,
+                            error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                            transition=args.transition)
+    url = "http://127.0.0.1:%d" % httpd.server_port
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        config_file = os.path.join(tmp, "config.json")
+        with open(config_file, "w") as f:
+            f.write("{}")
+
+        for action in args.actions:
+            times, rss, calls, failures = [], [], {}, 0
+            for _ in range(args.iterations):
+                # every run starts from a freshly powered on project
+                mock_call(url, "/_mock/reset", "POST")
+                elapsed, maxrss, code = run_agent(args, url, config_file, action)
+                times.append(elapsed)
+                rss.append(maxrss)
+                failures += code != 0
+                for name, count in mock_call(url, "/_mock/stats").items():
+                    calls[name] = calls.get(name, 0) + count
+            results[action] = {
+                "p50": percentile(times, 50),
+                "p99": percentile(times, 99),
+                "calls": round(sum(calls.values()) / float(args.iterations), 2),
+                "calls_by_api": {name: round(count / float(args.iterations), 2) for name, count in sorted(calls.items())},
+                "max_rss_kib": max(rss),
+                "failures": failures,
+            }
+    httpd.shutdown()
+    return results
+
+
+def report(results):
+    print("%-8s %9s %9s %7s %10s %5s  %s" % ("action", "p50 ms", "p99 ms", "calls", "rss KiB", "fail", "calls by API"))
+    for action, r in results.items():
+        by_api = ", ".join("%s=%s" % item for item in r["calls_by_api"].items())
+        print("%-8s %9.1f %9.1f %7.2f %10d %5d  %s" % (action, r["p50"] * 1000, r["p99"] * 1000,
+                                                       r["calls"], r["max_rss_kib"], r["failures"], by_api))
+
+
+def compare(results, baseline, tolerance):
+    """Return the list of regressions against a saved run"""
+    regressions = []
+    for action, r in results.items():
+        base = baseline.get(action)
+        if base is None:
+            continue
+        if r["p50"] > base["p50"] * (1 + tolerance):
+            regressions.append("%s: p50 %.1f ms vs %.1f ms" % (action, r["p50"] * 1000, base["p50"] * 1000))
+        if r["calls"] > base["calls"]:
+            regressions.append("%s: %.2f API calls vs %.2f" % (action, r["calls"], base["calls"]))
+        if r["max_rss_kib"] > base["max_rss_kib"] * (1 + tolerance):
+            regressions.append("%s: peak RSS %d KiB vs %d KiB" % (action, r["max_rss_kib"], base["max_rss_kib"]))
+        if r["failures"] > base["failures"]:
+            regressions.append("%s: %d failed runs vs %d" % (action, r["failures"], base["failures"]))
+    return regressions
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agent", default=os.path.join(here, "fence_huaweicloud.py"))
+    parser.add_argument("--python", default=sys.executable, help="interpreter used to run the agent")
+    parser.add_argument("--actions", default=",".join(ACTIONS), help="comma separated list of actions")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--servers", type=int, default=200, help="servers in the mock project")
+    parser.add_argument("--latency-ms", type=float, default=20, help="mock API latency per request")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    parser.add_argument("--transition", type=float, default=0.5, help="seconds a mock power action takes")
+    parser.add_argument("--save", metavar="FILE", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare with results saved by --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 and peak RSS growth (0.2 = 20%%)")
+    parser.add_argument("--verbose", action="store_true", help="show agent stderr of failed runs")
+    args = parser.parse_args()
+    args.actions = [a for a in args.actions.split(",") if a]
+
+    results = benchmark(args)
+    report(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION %s" % line)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against %s" % args.compare)
+
+
+if __name__ == "__main__":
+    main()
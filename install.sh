@@ -145,10 +145,14 @@ else
     print_warning "Pacemaker tools (pcs) not detected. Install if you plan to use with Pacemaker/Corosync."
 fi
 
-# Create a sample config file if it doesn't exist
-if [ ! -f "config.json" ]; then
-    print_info "Creating sample config.json file..."
-    cat > config.json << 'EOF'
+# Install a sample config next to the default --config-file location; it is
+# not read until it is copied to config.json and filled in
+CONFIG_DIR="/etc/fence_huaweicloud"
+if [ ! -f "$CONFIG_DIR/config.json.example" ]; then
+    print_info "Creating sample $CONFIG_DIR/config.json.example file..."
+    mkdir -p "$CONFIG_DIR"
+    chmod 700 "$CONFIG_DIR"
+    (umask 077 && cat > "$CONFIG_DIR/config.json.example" << 'EOF'
 {
   "region": "cn-north-1",
   "access_key": "your_access_key_here",
@@ -158,7 +162,8 @@ if [ ! -f "config.json" ]; then
   "enterprise_project_id": "0"
 }
 EOF
-    print_info "Sample config.json created. Update with your actual credentials."
+    )
+    print_info "Sample $CONFIG_DIR/config.json.example created. Copy it to config.json (mode 0600) and fill in your credentials."
 fi
 
 print_success ""
@@ -167,7 +172,7 @@ print_success ""
 
 print_info "Configuration options:"
 print_info "- Direct parameters: provide access_key, secret_key, region, project_id directly"
-print_info "- Config file: create config.json with credentials and use --config-file parameter"
+print_info "- Config file: /etc/fence_huaweicloud/config.json is read by default, --config-file selects another one"
 print_info ""
 
 print_info "Basic usage examples:"
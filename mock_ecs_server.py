@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Huawei Cloud ECS API endpoints used by fence_huaweicloud.py.
+
+Implements ShowServer, ListServersDetails, BatchStartServers, BatchStopServers,
+BatchRebootServers, ShowJob and NovaListServersDetails (with changes-since,
+and tags only from compute microversion 2.26 like Nova) with configurable latency, error injection, throttling (at random or beyond a
+requests per second quota) and power state
+transitions. Point the agent at it with
+--endpoint http://127.0.0.1:<port> (requests are not authenticated).
+The IAM CreateTemporaryAccessKeyByAgency and KeystoneListAuthDomains calls
+used by --assume-agency are served too, for --iam-endpoint. With --notify-url
+every finished power transition is pushed there as an SMN HTTP notification
+carrying a Cloud Eye ECS event, for the agent's --event-listen.
+
+Extra endpoints for test harnesses:
+  GET  /_mock/stats   API calls per action since the last reset
+  POST /_mock/reset   reset call counters and power all servers on
+  POST /_mock/servers/<id>
+                      create or change a server, JSON body with any of name,
+                      ip, tags, status, task_state or {"deleted": true}
+"""
+
+import argparse
+import calendar
+import collections
+import json
+import random
+import re
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def server_id(index):
+    return "00000000-0000-4000-8000-%012d" % index
+
+
+def _timestamp(seconds):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds))
+
+
+class MockEcs:
+    """In-memory ECS project: servers, jobs and per-action call counters"""
+
+    def __init__(self, servers=10, latency=0.0, jitter=0.2, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1, transition=1.0, fail_servers=(), first_server=0, token_lifetime=None,
+                 notify_url=None, quota=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.transition = transition
+        self.fail_servers = set(fail_servers)
+        self.lock = threading.Lock()
+        self.server_count = servers
+        self.first_server = first_server
+        # overrides the duration_seconds asked for with temporary credentials
+        self.token_lifetime = token_lifetime
+        self.notify_url = notify_url
+        # requests per second of the tenant, more are throttled like the API gateway does
+        self.quota = quota
+        self.recent = collections.deque()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = {}
+            self.jobs = {}
+            self.servers = {}
+            for i in range(self.first_server, self.first_server + self.server_count):
+                sid = server_id(i)
+                self.servers[sid] = {
+                    "id": sid,
+                    "name": "node-%d" % i,
+                    "ip": "192.168.%d.%d" % (i // 250, i % 250 + 2),
+                    "tags": ["cluster=ha1", "hostname=node-%d" % i],
+                    "status": "ACTIVE",
+                    "task_state": None,
+                    "pending": None,
+                    "created": time.time(),
+                    "updated": time.time(),
+                }
+            self.deleted = {}
+
+    def count(self, action):
+        with self.lock:
+            self.calls[action] = self.calls.get(action, 0) + 1
+
+    def over_quota(self):
+        """Record a request, True when it is beyond the quota of the last second"""
+        if not self.quota:
+            return False
+        now = time.time()
+        with self.lock:
+            while self.recent and self.recent[0] <= now - 1:
+                self.recent.popleft()
+            if len(self.recent) >= self.quota:
+                self.calls["Throttled"] = self.calls.get("Throttled", 0) + 1
+                return True
+            self.recent.append(now)
+            return False
+
+    def _settle(self, server):
+        """Apply a finished transition"""
+        pending = server["pending"]
+        if pending and time.time() >= pending[1]:
+            server["status"] = pending[0]
+            server["task_state"] = None
+            server["pending"] = None
+            server["updated"] = pending[1]
+
+    def server_detail(self, sid):
+        server = self.servers.get(sid)
+        if server is None:
+            return {"id": sid, "fault": {"code": 404, "message": "Instance could not be found"}}
+        self._settle(server)
+        power_state = 1 if server["status"] not in ["SHUTOFF"] else 4
+        return {
+            "id": sid,
+            "name": server["name"],
+            "status": server["status"],
+            "updated": _timestamp(server["updated"]),
+            "OS-EXT-STS:task_state": server["task_state"],
+            "OS-EXT-STS:vm_state": {"SHUTOFF": "stopped", "ERROR": "error", "SHELVED": "shelved",
+                                    "SHELVED_OFFLOADED": "shelved_offloaded"}.get(server["status"], "active"),
+            "OS-EXT-STS:power_state": power_state,
+            "addresses": {"subnet-1": [{"addr": server["ip"], "version": 4, "OS-EXT-IPS:type": "fixed"}]},
+            "flavor": {"id": "s6.large.2", "name": "s6.large.2", "vcpus": "2", "ram": "4096", "disk": "0"},
+            "tags": server["tags"],
+            "metadata": {},
+            "enterprise_project_id": "0",
+        }
+
+    def list_servers(self, query):
+        limit = int(query.get("limit", ["25"])[0])
+        page = max(int(query.get("offset", ["1"])[0]), 1)
+        with self.lock:
+            if "server_id" in query:
+                details = [self.server_detail(sid) for sid in query["server_id"][0].split(",") if sid in self.servers]
+                return {"count": len(details), "servers": details}
+            details = [self.server_detail(sid) for sid in sorted(self.servers)]
+        for key, match in [("name", lambda d, v: v in d["name"]),
+                           ("status", lambda d, v: d["status"] == v),
+                           ("ip_eq", lambda d, v: any(a["addr"] == v for a in d["addresses"]["subnet-1"])),
+                           ("tags", lambda d, v: v in d["tags"])]:
+            if key in query:
+                details = [d for d in details if match(d, query[key][0])]
+        return {"count": len(details), "servers": details[(page - 1) * limit:page * limit]}
+
+    def nova_list_servers(self, query, microversion=None):
+        """Native OpenStack listing, paged with marker and filtered with changes-since
+
+        Servers carry tags only when the OpenStack-API-Version header asks
+        for compute 2.26 or later.
+        """
+        match = re.match(r"^compute (\d+)\.(\d+)$", (microversion or "").strip())
+        with_tags = bool(match) and (int(match.group(1)), int(match.group(2))) >= (2, 26)
+        limit = int(query.get("limit", ["1000"])[0])
+        marker = query.get("marker", [None])[0]
+        since = query.get("changes-since", [None])[0]
+        since = calendar.timegm(time.strptime(since, "%Y-%m-%dT%H:%M:%SZ")) if since else None
+        with self.lock:
+            servers = []
+            for sid in sorted(set(self.servers) | set(self.deleted if since is not None else [])):
+                server = self.servers.get(sid) or self.deleted[sid]
+                self._settle(server)
+                if (marker and sid <= marker) or (since is not None and server["updated"] < since):
+                    continue
+                item = {
+                    "id": sid,
+                    "name": server["name"],
+                    "status": "DELETED" if sid in self.deleted else server["status"],
+                    "created": _timestamp(server["created"]),
+                    "updated": _timestamp(server["updated"]),
+                    "addresses": {"subnet-1": [{"addr": server["ip"], "version": 4, "OS-EXT-IPS:type": "fixed"}]},
+                    "metadata": {},
+                }
+                if with_tags:
+                    item["tags"] = server["tags"]
+                servers.append(item)
+        return {"servers": servers[:limit]}
+
+    def change_server(self, sid, body):
+        """Create, rename, re-address, re-tag, re-state or delete a server"""
+        with self.lock:
+            server = self.servers.get(sid)
+            if server is None:
+                server = self.servers[sid] = {"id": sid, "name": sid, "ip": "10.0.0.1", "tags": [], "status": "ACTIVE",
+                                              "task_state": None, "pending": None, "created": time.time()}
+            for key in ["name", "ip", "tags", "status", "task_state"]:
+                if key in body:
+                    server[key] = body[key]
+            server["updated"] = time.time()
+            if body.get("deleted"):
+                self.deleted[sid] = self.servers.pop(sid)
+        return 200, {}
+
+    def server_action(self, body):
+        if "os-start" in body:
+            option, target, task = body["os-start"], "ACTIVE", "powering-on"
+            interim = None
+        elif "os-stop" in body:
+            option, target, task = body["os-stop"], "SHUTOFF", "powering-off"
+            interim = None
+        elif "reboot" in body:
+            option, target = body["reboot"], "ACTIVE"
+            hard = option.get("type") == "HARD"
+            task, interim = ("rebooting_hard", "HARD_REBOOT") if hard else ("rebooting", "REBOOT")
+        else:
+            return 400, {"error": {"code": "Ecs.0005", "message": "unsupported action"}}
+
+        job_id = uuid.uuid4().hex
+        due = time.time() + self.transition
+        sub_jobs = []
+        with self.lock:
+            for entry in option.get("servers", []):
+                sid = entry["id"]
+                server = self.servers.get(sid)
+                if server is None:
+                    return 404, {"error": {"code": "Ecs.0114", "message": "server %s not found" % sid}}
+                failed = sid in self.fail_servers
+                if not failed:
+                    server["task_state"] = task
+                    if interim:
+                        server["status"] = interim
+                    server["pending"] = (target, due)
+                    server["updated"] = time.time()
+                sub_jobs.append({"server_id": sid, "failed": failed})
+            self.jobs[job_id] = {"due": due, "sub_jobs": sub_jobs}
+        if self.notify_url:
+            event = {"os-start": "startServer", "os-stop": "stopServer"}.get(next(iter(body)), "rebootServer")
+            for sub in sub_jobs:
+                if not sub["failed"]:
+                    timer = threading.Timer(self.transition, self.notify, (sub["server_id"], event, target))
+                    timer.daemon = True
+                    timer.start()
+        return 200, {"job_id": job_id}
+
+    def notify(self, sid, event, status):
+        """Push a Cloud Eye ECS event to notify_url the way an SMN HTTP subscription does"""
+        message = {
+            "version": "v1",
+            "event_source": "SYS.ECS",
+            "event_name": event,
+            "event_state": "normal",
+            "resource_type": "ecs",
+            "resource_id": sid,
+            "time": int(time.time() * 1000),
+            "detail": {"status": status},
+        }
+        body = {
+            "type": "Notification",
+            "message_id": uuid.uuid4().hex,
+            "topic_urn": "urn:smn:mock:0123456789abcdef0123456789abcdef:ecs-events",
+            "subject": "ECS %s %s" % (event, sid),
+            "message": json.dumps(message),
+            "timestamp": _timestamp(time.time()),
+        }
+        request = urllib.request.Request(self.notify_url, data=json.dumps(body).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"})
+        self.count("SmnNotification")
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except OSError:
+            pass
+
+    def security_token(self, body):
+        assume_role = body.get("auth", {}).get("identity", {}).get("assume_role", {})
+        if not assume_role.get("agency_name") or not (assume_role.get("domain_name") or assume_role.get("domain_id")):
+            return 400, {"error": {"code": "IAM.0001", "message": "agency_name and domain required"}}
+        lifetime = self.token_lifetime or assume_role.get("duration_seconds", 900)
+        return 201, {"credential": {
+            "access": "TMP" + uuid.uuid4().hex[:17].upper(),
+            "secret": uuid.uuid4().hex,
+            "securitytoken": uuid.uuid4().hex * 4,
+            "expires_at": time.strftime("%Y-%m-%dT%H:%M:%S.000000Z", time.gmtime(time.time() + lifetime)),
+        }}
+
+    def show_job(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            return 404, {"error": {"code": "Ecs.0105", "message": "job not found"}}
+        done = time.time() >= job["due"]
+        sub_jobs = []
+        for sub in job["sub_jobs"]:
+            status = "RUNNING" if not done else ("FAIL" if sub["failed"] else "SUCCESS")
+            sub_jobs.append({
+                "status": status,
+                "job_id": uuid.uuid4().hex,
+                "job_type": "childJob",
+                "entities": {"server_id": sub["server_id"]},
+                "fail_reason": "Ecs.0000 injected failure" if status == "FAIL" else None,
+            })
+        status = "RUNNING"
+        if done:
+            status = "FAIL" if any(sub["failed"] for sub in job["sub_jobs"]) else "SUCCESS"
+        return 200, {
+            "job_id": job_id,
+            "job_type": "batchServerAction",
+            "status": status,
+            "entities": {"sub_jobs_total": len(sub_jobs), "sub_jobs": sub_jobs},
+            "fail_reason": "Ecs.0000 injected failure" if status == "FAIL" else None,
+        }
+
+
+class MockEcsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, code, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-Request-Id", uuid.uuid4().hex)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject(self, action):
+        """Simulate latency, throttling and server errors; True when a fault was sent"""
+        mock = self.mock
+        mock.count(action)
+        if mock.latency:
+            time.sleep(mock.latency * random.uniform(1 - mock.jitter, 1 + mock.jitter))
+        if random.random() < mock.throttle_rate or mock.over_quota():
+            self._reply(429, {"error_code": "APIGW.0308", "error_msg": "The throttling threshold has been reached"},
+                        {"Retry-After": str(mock.retry_after)})
+            return True
+        if random.random() < mock.error_rate:
+            self._reply(503, {"error_code": "Ecs.0001", "error_msg": "Service unavailable (injected)"})
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/_mock/stats":
+            with self.mock.lock:
+                self._reply(200, dict(self.mock.calls))
+            return
+
+        match = re.match(r"^/v1/[^/]+/cloudservers/detail$", url.path)
+        if match:
+            if not self._inject("ListServersDetails"):
+                self._reply(200, self.mock.list_servers(parse_qs(url.query)))
+            return
+
+        match = re.match(r"^/v1/[^/]+/cloudservers/([^/]+)$", url.path)
+        if match:
+            if not self._inject("ShowServer"):
+                with self.mock.lock:
+                    detail = self.mock.server_detail(match.group(1))
+                if "fault" in detail:
+                    self._reply(404, {"error": {"code": "Ecs.0114", "message": "Instance could not be found"}})
+                else:
+                    self._reply(200, {"server": detail})
+            return
+
+        if re.match(r"^/v2.1/[^/]+/servers/detail$", url.path):
+            if not self._inject("NovaListServersDetails"):
+                self._reply(200, self.mock.nova_list_servers(parse_qs(url.query), self.headers.get("OpenStack-API-Version")))
+            return
+
+        match = re.match(r"^/v1/[^/]+/jobs/([^/]+)$", url.path)
+        if match:
+            if not self._inject("ShowJob"):
+                self._reply(*self.mock.show_job(match.group(1)))
+            return
+
+        if url.path == "/v3/auth/domains":
+            if not self._inject("KeystoneListAuthDomains"):
+                self._reply(200, {"domains": [{"id": "0" * 32, "name": "mock-domain", "enabled": True}]})
+            return
+
+        self._reply(404, {"error": {"code": "Ecs.0000", "message": "unknown path %s" % url.path}})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+
+        if url.path == "/_mock/reset":
+            self.mock.reset()
+            self._reply(200, {})
+            return
+
+        match = re.match(r"^/_mock/servers/([^/]+)$", url.path)
+        if match:
+            self._reply(*self.mock.change_server(match.group(1), json.loads(raw or b"{}")))
+            return
+
+        if re.match(r"^/v1/[^/]+/cloudservers/action$", url.path):
+            body = json.loads(raw or b"{}")
+            action = {"os-start": "BatchStartServers", "os-stop": "BatchStopServers",
+                      "reboot": "BatchRebootServers"}.get(next(iter(body), ""), "ServerAction")
+            if not self._inject(action):
+                self._reply(*self.mock.server_action(body))
+            return
+
+        if url.path == "/v3.0/OS-CREDENTIAL/securitytokens":
+            if not self._inject("CreateTemporaryAccessKeyByAgency"):
+                self._reply(*self.mock.security_token(json.loads(raw or b"{}")))
+            return
+
+        self._reply(404, {"error": {"code": "Ecs.0000", "message": "unknown path %s" % url.path}})
+
+
+def start_server(host="127.0.0.1", port=0, **settings):
+    """Start a mock ECS endpoint in a background thread, returns (httpd, mock)"""
+    mock = MockEcs(**settings)
+    handler = type("BoundMockEcsHandler", (MockEcsHandler,), {"mock": mock})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, mock
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--servers", type=int, default=10, help="number of servers in the project")
+    parser.add_argument("--latency-ms", type=float, default=0, help="added latency per request")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429")
+    parser.add_argument("--quota", type=int, default=0, help="requests per second, more are answered with 429")
+    parser.add_argument("--transition", type=float, default=1.0, help="seconds a power action takes")
+    parser.add_argument("--fail-server", action="append", default=[], help="server ID whose actions fail")
+    parser.add_argument("--first-server", type=int, default=0,
+                        help="number of the first server, to give several mocks (regions) distinct IDs")
+    parser.add_argument("--token-lifetime", type=int, help="seconds temporary credentials are valid, overrides the request")
+    parser.add_argument("--notify-url", help="push SMN notifications of finished power transitions to this URL")
+    args = parser.parse_args()
+
+    httpd, _ = start_server(args.host, args.port, servers=args.servers, latency=args.latency_ms / 1000.0,
+                            error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                            retry_after=args.retry_after, transition=args.transition, quota=args.quota,
+                            fail_servers=args.fail_server, first_server=args.first_server,
+                            token_lifetime=args.token_lifetime, notify_url=args.notify_url)
+    print("Mock ECS API listening on http://%s:%d (first server %s)" % (args.host, httpd.server_port,
+                                                                      server_id(args.first_server)))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
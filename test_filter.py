@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Table tests of how _compile_filter splits --filter into ListServersDetails
+query parameters and a client-side predicate.
+
+Needs the fence-agents library next to the agent
+(fence-agents/lib/fencing.py), skipped otherwise.
+"""
+
+import importlib.util
+import os
+from types import SimpleNamespace
+
+import pytest
+
+AGENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fence_huaweicloud.py")
+FENCING_LIB = os.path.join(os.path.dirname(AGENT), "fence-agents", "lib", "fencing.py")
+
+pytestmark = pytest.mark.skipif(not os.path.exists(FENCING_LIB), reason="needs fence-agents/lib/fencing.py")
+
+
+@pytest.fixture(scope="module")
+def agent():
+    spec = importlib.util.spec_from_file_location("fence_huaweicloud", AGENT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def server(name="node-1", status="ACTIVE", tags=None, flavor="s6.large.2", ips=None):
+    """Stand-in for an SDK ServerDetail with the attributes the filter reads"""
+    addresses = {"subnet-1": [SimpleNamespace(addr=ip) for ip in (ips or ["10.0.0.1"])]}
+    return SimpleNamespace(name=name, status=status, tags=tags or ["cluster=ha1"], addresses=addresses,
+                           flavor=SimpleNamespace(id=flavor, name=flavor), enterprise_project_id="0")
+
+
+# (--filter, query, checked locally)
+SPLIT = [
+    ("", {}, False),
+    ("status=ACTIVE", {"status": "ACTIVE"}, False),
+    (" status = ACTIVE , ", {"status": "ACTIVE"}, False),
+    ("tags=cluster=ha1", {"tags": "cluster=ha1"}, False),
+    ("ip=10.0.0.1", {"ip_eq": "10.0.0.1"}, False),
+    ("flavor=s6.large.2,status=ACTIVE", {"flavor": "s6.large.2", "status": "ACTIVE"}, False),
+    # the API matches names as substrings, a literal name is checked again
+    ("name=node-1", {"name": "node-1"}, True),
+    ("name=node-*", {}, True),
+    ("name=node-?,status=ACTIVE", {"status": "ACTIVE"}, True),
+    ("status=ACTIVE,status=SHUTOFF", {}, True),
+    ("flavor=s6.*", {}, True),
+]
+
+
+@pytest.mark.parametrize("expr,query,local", SPLIT)
+def test_filter_split(agent, expr, query, local):
+    compiled_query, predicate = agent._compile_filter(expr)
+    assert compiled_query == query
+    assert (predicate is not None) == local
+
+
+# (--filter, server, matches)
+MATCH = [
+    ("name=node-1", server(name="node-1"), True),
+    ("name=node-1", server(name="node-10"), False),
+    ("name=node-1", server(name="mynode-1"), False),
+    ("name=node-1*", server(name="node-10"), True),
+    ("name=node-?", server(name="node-10"), False),
+    ("status=ACTIVE,status=SHUTOFF", server(status="SHUTOFF"), True),
+    ("status=ACTIVE,status=SHUTOFF", server(status="ERROR"), False),
+    ("name=node-*,flavor=s6.*", server(flavor="c7.large.2"), False),
+    ("name=node-*,name=db-*", server(name="db-2"), True),
+    ("flavor=s6.*", server(flavor="c7.large.2"), False),
+    ("ip=10.0.0.*", server(ips=["192.168.0.5", "10.0.0.7"]), True),
+    ("tags=cluster=*", server(tags=["env=prod"]), False),
+]
+
+
+@pytest.mark.parametrize("expr,instance,matches", MATCH)
+def test_filter_match(agent, expr, instance, matches):
+    _, predicate = agent._compile_filter(expr)
+    assert predicate(instance) == matches
+
+
+@pytest.mark.parametrize("expr", ["owner=me", "status", "status=ACTIVE,zone=az1"])
+def test_filter_invalid(agent, expr):
+    with pytest.raises(SystemExit):
+        agent._compile_filter(expr)
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+End-to-end tests running agent processes against mock_ecs_server.py, and
+of the shared rate limiter.
+
+Needs the Huawei Cloud SDK and the fence-agents library next to the agent
+(fence-agents/lib/fencing.py), skipped otherwise. The agents share state in
+/run/fence_huaweicloud like real ones; every test uses its own project ID
+so their lock files do not meet.
+"""
+
+import fcntl
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+
+import pytest
+
+from mock_ecs_server import server_id, start_server
+
+AGENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fence_huaweicloud.py")
+FENCING_LIB = os.path.join(os.path.dirname(AGENT), "fence-agents", "lib", "fencing.py")
+
+pytestmark = pytest.mark.skipif(
+    not os.path.exists(FENCING_LIB) or importlib.util.find_spec("huaweicloudsdkecs") is None,
+    reason="needs the Huawei Cloud SDK and fence-agents/lib/fencing.py")
+
+
+@pytest.fixture
+def module():
+    spec = importlib.util.spec_from_file_location("fence_huaweicloud", AGENT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def mock():
+    """(url, MockEcs, project ID) of a fresh mock project"""
+    started = []
+
+    def start(**settings):
+        httpd, ecs = start_server(**settings)
+        started.append(httpd)
+        return "http://127.0.0.1:%d" % httpd.server_port, ecs, uuid.uuid4().hex
+
+    yield start
+    for httpd in started:
+        httpd.shutdown()
+
+
+def agent(url, project_id, *args):
+    """Start an agent process, no daemon and no caches that would hide API calls"""
+    cmd = [sys.executable, AGENT, "-a", "ak", "-s", "sk", "-r", "cn-north-4", "--project-id", project_id,
+           "--endpoint", url, "--daemon-socket", "/nonexistent/daemon.sock", "--power-wait", "0",
+           "--status-cache-ttl", "0", "--monitor-cache-ttl", "0", "-v"] + list(args)
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def finish(process):
+    out, err = process.communicate(timeout=120)
+    return process.returncode, out, err
+
+
+def stats(url):
+    with urllib.request.urlopen(url + "/_mock/stats") as response:
+        return json.loads(response.read())
+
+
+def test_concurrent_offs_share_one_request(mock):
+    url, _, project_id = mock(servers=3, transition=2)
+    processes = [agent(url, project_id, "-o", "off", "-n", server_id(1)) for _ in range(2)]
+    results = [finish(process) for process in processes]
+    assert [(rc, out.strip()) for rc, out, _ in results] == [(0, "Success: Powered OFF")] * 2
+    assert stats(url)["BatchStopServers"] == 1
+    assert sum("was done by a concurrent request" in err for _, _, err in results) == 1
+
+
+def test_concurrent_failure_is_shared(mock):
+    url, _, project_id = mock(servers=3, transition=1, fail_servers=[server_id(1)])
+    processes = [agent(url, project_id, "-o", "off", "-n", server_id(1)) for _ in range(2)]
+    results = [finish(process) for process in processes]
+    assert [rc for rc, _, _ in results] == [1, 1]
+    assert all("injected failure" in err for _, _, err in results)
+    assert stats(url)["BatchStopServers"] == 1
+
+
+def test_waiting_request_times_out(mock):
+    url, _, project_id = mock(servers=3, transition=6)
+    first = agent(url, project_id, "-o", "off", "-n", server_id(1))
+    time.sleep(1.5)
+    started = time.time()
+    second = agent(url, project_id, "-o", "off", "-n", server_id(1), "--power-timeout", "2")
+    rc, _, err = finish(second)
+    assert rc == 7
+    assert "Timed out waiting for the concurrent off" in err
+    assert time.time() - started < 5
+    assert finish(first)[0] == 0
+    assert stats(url)["BatchStopServers"] == 1
+
+
+def test_abandoned_lock_is_taken_over(module, mock):
+    url, _, project_id = mock(servers=3, transition=1)
+    options = {"--region": "cn-north-4", "--project-id": project_id}
+    # a request that died holding the lock leaves no outcome behind
+    with module._inflight_file(options, server_id(1), "off") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        waiting = agent(url, project_id, "-o", "off", "-n", server_id(1))
+        time.sleep(2)
+        assert waiting.poll() is None
+        assert "BatchStopServers" not in stats(url)
+    rc, out, _ = finish(waiting)
+    assert (rc, out.strip()) == (0, "Success: Powered OFF")
+    assert stats(url)["BatchStopServers"] == 1
+
+
+def test_unreachable_region_does_not_block_others(mock):
+    url, _, project_id = mock(servers=3, transition=1)
+    refused = socket.socket()
+    refused.bind(("127.0.0.1", 0))
+    dead = "http://127.0.0.1:%d" % refused.getsockname()[1]
+    refused.close()
+    scopes = ["-r", "cn-north-1,cn-north-4", "--project-id", "%s,%s" % (uuid.uuid4().hex, project_id),
+              "--endpoint", "%s,%s" % (dead, url), "--power-timeout", "3"]
+    rc, out, err = finish(agent(url, project_id, "-o", "off", "-n", server_id(1), *scopes))
+    assert (rc, out.strip()) == (0, "Success: Powered OFF")
+    assert "Failed to look up instances in region cn-north-1" in err
+    # an instance missing from the reachable scopes may be in the other one
+    rc, _, err = finish(agent(url, project_id, "-o", "status", "-n", "missing", *scopes))
+    assert rc == 1
+    assert "not found in the regions/projects that could be queried" in err
+    assert stats(url)["BatchStopServers"] == 1
+
+
+def test_plug_by_tag(mock):
+    url, ecs, project_id = mock(servers=3, transition=1)
+    rc, out, _ = finish(agent(url, project_id, "-o", "status", "--plug-by", "tag:hostname", "-n", "node-2"))
+    assert (rc, out.strip()) == (0, "Status: ON")
+    # a retagged server is found under its new tag
+    ecs.change_server(server_id(3), {"tags": ["hostname=db-1"]})
+    rc, out, err = finish(agent(url, project_id, "-o", "off", "--plug-by", "tag:hostname", "-n", "db-1"))
+    assert (rc, out.strip()) == (0, "Success: Powered OFF")
+    assert "plug db-1 is instance %s" % server_id(3) in err
+
+
+def test_mock_returns_tags_from_microversion_2_26(mock):
+    url, _, project_id = mock(servers=1)
+    listings = []
+    for version in [None, "compute 2.1", "compute 2.26"]:
+        request = urllib.request.Request(url + "/v2.1/%s/servers/detail" % project_id)
+        if version:
+            request.add_header("OpenStack-API-Version", version)
+        with urllib.request.urlopen(request) as response:
+            listings.append(json.loads(response.read())["servers"][0])
+    assert ["tags" in server for server in listings] == [False, False, True]
+
+
+@pytest.fixture
+def limiter(module, tmp_path, monkeypatch):
+    """The agent module with a read bucket of 4/s in a private STATE_DIR"""
+    monkeypatch.setattr(module, "STATE_DIR", str(tmp_path))
+    monkeypatch.setitem(module.RATE_LIMITS, "read", 4.0)
+    monkeypatch.setitem(module.RATE_LIMIT_WAIT, "seconds", 0.0)
+    monkeypatch.setattr(module._METRICS, "priority", False)
+    return module
+
+
+def test_rate_limit_keeps_reserve(limiter):
+    # status, list and monitor stop at half of the bucket
+    for _ in range(2):
+        limiter._rate_limit(False)
+    assert limiter.RATE_LIMIT_WAIT["seconds"] == 0
+    limiter._METRICS.priority = True
+    for _ in range(2):
+        limiter._rate_limit(False)
+    assert limiter.RATE_LIMIT_WAIT["seconds"] == 0
+    limiter._rate_limit(False)
+    assert 0.2 <= limiter.RATE_LIMIT_WAIT["seconds"] <= 0.3
+
+
+def test_rate_limit_background_waits(limiter):
+    for _ in range(3):
+        limiter._rate_limit(False)
+    assert 0.2 <= limiter.RATE_LIMIT_WAIT["seconds"] <= 0.3
+
+
+def test_rate_limit_refills(limiter):
+    limiter._METRICS.priority = True
+    for _ in range(4):
+        limiter._rate_limit(False)
+    time.sleep(0.5)
+    for _ in range(2):
+        limiter._rate_limit(False)
+    assert limiter.RATE_LIMIT_WAIT["seconds"] == 0
+    # the bucket is shared through the state file, not kept in the process
+    with limiter._state_file("rate-limit.json") as buckets:
+        assert buckets["read"][0] < 1
+
+
+def test_rate_limit_disabled(limiter, tmp_path, monkeypatch):
+    monkeypatch.setitem(limiter.RATE_LIMITS, "read", 0.0)
+    for _ in range(10):
+        limiter._rate_limit(False)
+    assert limiter.RATE_LIMIT_WAIT["seconds"] == 0
+    assert not os.path.exists(os.path.join(str(tmp_path), "rate-limit.json"))
+
+
+def storm(url, project_id, *limits):
+    """12 status and 12 monitor runs plus one off, the result of the off"""
+    noise = [agent(url, project_id, "-o", action, "-n", server_id(1 + i % 8), *limits)
+             for i in range(12) for action in ["status", "monitor"]]
+    off = agent(url, project_id, "-o", "off", "-n", server_id(9), *limits)
+    for process in noise:
+        finish(process)
+    return finish(off)
+
+
+def test_storm_is_throttled_without_limiter(mock):
+    url, _, project_id = mock(servers=10, transition=2, quota=10)
+    rc, _, _ = storm(url, project_id, "--rate-limit-read", "0", "--rate-limit-write", "0")
+    assert rc == 0
+    assert stats(url).get("Throttled", 0) > 0
+
+
+def test_storm_stays_under_quota_with_limiter(mock):
+    url, _, project_id = mock(servers=10, transition=2, quota=10)
+    rc, out, err = storm(url, project_id, "--rate-limit-read", "4", "--rate-limit-write", "1")
+    assert (rc, out.strip()) == (0, "Success: Powered OFF")
+    assert stats(url).get("Throttled", 0) == 0
+    # monitor and status waited, the fence did not
+    assert "rate limit: waited" not in err
+
+
+def test_daemon_requests_ignore_daemon_options(mock, tmp_path):
+    url, ecs, project_id = mock(servers=3, transition=1, fail_servers=[server_id(2)])
+    bodies = []
+    server_action = ecs.server_action
+    ecs.server_action = lambda body: bodies.append(body) or server_action(body)
+    socket_path = str(tmp_path / "daemon.sock")
+    common = ["-a", "ak", "-s", "sk", "-r", "cn-north-4", "--project-id", project_id, "--endpoint", url,
+              "--daemon-socket", socket_path, "--power-wait", "0"]
+    daemon = subprocess.Popen([sys.executable, AGENT, "--daemon", "--force", "-o", "monitor"] + common,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    try:
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.1)
+        client = subprocess.run([sys.executable, AGENT, "-o", "off", "-n", server_id(1)] + common,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        assert (client.returncode, client.stdout.strip()) == (0, "Success: Powered OFF")
+        # --force of the daemon did not make it a hard stop
+        assert [body["os-stop"]["type"] for body in bodies] == ["SOFT"]
+        # errors logged by the daemon reach the client's stderr
+        client = subprocess.run([sys.executable, AGENT, "-o", "off", "-n", server_id(2)] + common,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        assert client.returncode == 1
+        assert "injected failure" in client.stderr
+        assert stats(url)["BatchStopServers"] == 2
+    finally:
+        daemon.terminate()
+        daemon.communicate(timeout=30)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Table tests of power_state, the mapping of ECS status, vm_state and
+task_state readings to the power state the agent reports.
+
+Needs the fence-agents library next to the agent
+(fence-agents/lib/fencing.py), skipped otherwise.
+"""
+
+import importlib.util
+import os
+
+import pytest
+
+AGENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fence_huaweicloud.py")
+FENCING_LIB = os.path.join(os.path.dirname(AGENT), "fence-agents", "lib", "fencing.py")
+
+pytestmark = pytest.mark.skipif(not os.path.exists(FENCING_LIB), reason="needs fence-agents/lib/fencing.py")
+
+
+@pytest.fixture(scope="module")
+def agent():
+    spec = importlib.util.spec_from_file_location("fence_huaweicloud", AGENT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# (status, vm_state, task_state, PowerState constant)
+STATES = [
+    ("ACTIVE", "active", None, "POWER_ON"),
+    ("SHUTOFF", "stopped", None, "POWER_OFF"),
+    ("STOPPED", None, None, "POWER_OFF"),
+    ("SHELVED_OFFLOADED", "shelved_offloaded", None, "POWER_OFF"),
+    ("DELETED", "deleted", None, "POWER_GONE"),
+    ("SOFT_DELETED", "soft-delete", None, "POWER_GONE"),
+    # power changes in progress
+    ("ACTIVE", "active", "powering-off", "POWER_TRANSITIONAL"),
+    ("ACTIVE", "active", "rebooting", "POWER_TRANSITIONAL"),
+    ("SHUTOFF", "stopped", "powering-on", "POWER_STARTING"),
+    ("SHUTOFF", "stopped", "rebuilding", "POWER_STARTING"),
+    ("BUILD", "building", "spawning", "POWER_TRANSITIONAL"),
+    ("REBOOT", "active", "reboot_started", "POWER_TRANSITIONAL"),
+    ("HARD_REBOOT", "active", "rebooting_hard", "POWER_TRANSITIONAL"),
+    ("MIGRATING", "active", "migrating", "POWER_TRANSITIONAL"),
+    ("RESIZE", "active", "resize_prep", "POWER_TRANSITIONAL"),
+    ("ACTIVE", "active", "deleting", "POWER_TRANSITIONAL"),
+    # task states that do not change the power
+    ("ACTIVE", "active", "image_snapshot", "POWER_ON"),
+    ("SHUTOFF", "stopped", "image_uploading", "POWER_OFF"),
+    # vm_state decides for statuses without a fixed power state
+    ("ERROR", "active", None, "POWER_ON"),
+    ("ERROR", "stopped", None, "POWER_OFF"),
+    ("ERROR", "building", None, "POWER_TRANSITIONAL"),
+    ("ERROR", "error", None, "POWER_UNKNOWN"),
+    ("UNKNOWN", None, None, "POWER_UNKNOWN"),
+    ("UNKNOWN", None, "powering-on", "POWER_UNKNOWN"),
+    ("SOMETHING_NEW", None, None, "POWER_UNKNOWN"),
+    (None, None, None, "POWER_UNKNOWN"),
+]
+
+
+@pytest.mark.parametrize("status,vm_state,task_state,expected", STATES)
+def test_power_state(agent, status, vm_state, task_state, expected):
+    assert agent.power_state(status, vm_state, task_state) is getattr(agent, expected)
+
+
+@pytest.mark.parametrize("name,state,power", [
+    ("POWER_ON", "on", "on"),
+    ("POWER_OFF", "off", "off"),
+    ("POWER_STARTING", "transitioning", "off"),
+    ("POWER_TRANSITIONAL", "transitioning", "on"),
+    ("POWER_GONE", "gone", "unknown"),
+    ("POWER_UNKNOWN", "unknown", "unknown"),
+])
+def test_reported_power(agent, name, state, power):
+    # fence_action sees the side a transition starts from
+    assert getattr(agent, name) == (state, power)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Table tests of the _send_request retry policy and Retry-After parsing.
+
+Needs the Huawei Cloud SDK and the fence-agents library next to the agent
+(fence-agents/lib/fencing.py), skipped otherwise.
+"""
+
+import email.utils
+import importlib.util
+import os
+import time
+
+import pytest
+
+AGENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fence_huaweicloud.py")
+FENCING_LIB = os.path.join(os.path.dirname(AGENT), "fence-agents", "lib", "fencing.py")
+
+pytestmark = pytest.mark.skipif(
+    not os.path.exists(FENCING_LIB) or importlib.util.find_spec("huaweicloudsdkecs") is None,
+    reason="needs the Huawei Cloud SDK and fence-agents/lib/fencing.py")
+
+
+@pytest.fixture(scope="module")
+def agent():
+    spec = importlib.util.spec_from_file_location("fence_huaweicloud", AGENT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module._load_sdk()
+    return module
+
+
+class Response(object):
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def service_error(agent, status_code, error_code):
+    sdk_error = agent.exceptions.SdkError(request_id="r", error_code=error_code, error_msg="injected")
+    if status_code < 500:
+        return agent.exceptions.ClientRequestException(status_code, sdk_error)
+    return agent.exceptions.ServerResponseException(status_code, sdk_error)
+
+
+# (error, read retried, write retried)
+POLICY = [
+    (lambda a: service_error(a, 429, "APIGW.0308"), True, True),
+    (lambda a: service_error(a, 400, "APIGW.0308"), True, True),
+    (lambda a: service_error(a, 503, "Ecs.0001"), True, True),
+    (lambda a: service_error(a, 500, "Ecs.0002"), True, False),
+    (lambda a: service_error(a, 502, "APIGW.0201"), True, False),
+    (lambda a: service_error(a, 504, "APIGW.0202"), True, False),
+    (lambda a: service_error(a, 401, "APIGW.0301"), False, False),
+    (lambda a: service_error(a, 403, "Ecs.0005"), False, False),
+    (lambda a: service_error(a, 409, "Ecs.0013"), False, False),
+    (lambda a: a.exceptions.SslHandShakeException("bad certificate"), False, False),
+    (lambda a: a.exceptions.RequestTimeoutException("read timed out"), True, False),
+    (lambda a: a.exceptions.ConnectionException("connection reset by peer"), True, False),
+    (lambda a: a.exceptions.HostUnreachableException("Name or service not known"), True, True),
+    (lambda a: ValueError("not an API error"), False, False),
+]
+
+
+@pytest.mark.parametrize("make_error,read,write", POLICY)
+def test_retry_policy(agent, make_error, read, write):
+    agent._remember_response()
+    error = make_error(agent)
+    deadline = time.time() + 60
+    assert (agent._retry_delay(error, False, 0, deadline) is not None) == read
+    assert (agent._retry_delay(error, True, 0, deadline) is not None) == write
+
+
+def test_retry_limits(agent):
+    agent._remember_response()
+    error = service_error(agent, 503, "Ecs.0001")
+    assert agent._retry_delay(error, False, agent.RETRY_MAX_ATTEMPTS - 1, time.time() + 60) is None
+    # a retry must not end after the request's deadline
+    assert agent._retry_delay(error, False, 0, time.time() - 1) is None
+    for attempt in range(agent.RETRY_MAX_ATTEMPTS - 1):
+        delay = agent._retry_delay(error, False, attempt, time.time() + 60)
+        assert 0 <= delay <= min(agent.RETRY_MAX_DELAY, agent.RETRY_BASE_DELAY * 2 ** attempt)
+
+
+@pytest.mark.parametrize("status,header,expected", [
+    (429, "7", 7.0),
+    (429, "2.5", 2.5),
+    (503, None, None),
+    (200, "7", None),
+    (429, "soon", None),
+])
+def test_retry_after_seconds(agent, status, header, expected):
+    agent._remember_response(Response(status, {"Retry-After": header} if header else {}))
+    assert agent._LAST_RESPONSE.retry_after == expected
+
+
+def test_retry_after_date(agent):
+    when = email.utils.formatdate(time.time() + 30, usegmt=True)
+    agent._remember_response(Response(429, {"Retry-After": when}))
+    assert 28 <= agent._LAST_RESPONSE.retry_after <= 30
+    # a date in the past means now
+    agent._remember_response(Response(429, {"Retry-After": email.utils.formatdate(time.time() - 30, usegmt=True)}))
+    assert agent._LAST_RESPONSE.retry_after == 0
+
+
+def test_retry_after_overrides_backoff(agent):
+    agent._remember_response(Response(429, {"Retry-After": "5"}))
+    delay = agent._retry_delay(service_error(agent, 429, "APIGW.0308"), True, 0, time.time() + 60)
+    assert delay == 5
+    # but not beyond the deadline
+    agent._remember_response(Response(429, {"Retry-After": "120"}))
+    assert agent._retry_delay(service_error(agent, 429, "APIGW.0308"), True, 0, time.time() + 60) is None